@@ -1,16 +1,22 @@
 import os
-import io
+import re
 import uuid
+import atexit
+import threading
 from datetime import datetime
 import json
+import logging
+from types import MappingProxyType
+from concurrent.futures import Future, ThreadPoolExecutor
 
 import streamlit as st
 import streamlit.components.v1 as components
-import pandas as pd
 from dotenv import load_dotenv
 
 # Hugging Face Hub
-from huggingface_hub import HfApi, hf_hub_download, HfFolder
+from huggingface_hub import CommitOperationAdd, HfApi, HfFolder
+
+logger = logging.getLogger(__name__)
 
 # Define survey flow
 steps = ["consent", "demographics", "baseline", "session_emp", "session_neu", "open", "review"]
@@ -21,7 +27,17 @@ steps = ["consent", "demographics", "baseline", "session_emp", "session_neu", "o
 load_dotenv()
 HF_TOKEN = os.getenv("HF_TOKEN")
 HF_DATASET_REPO = os.getenv("HF_DATASET_REPO")        
-HF_DATASET_PATH = os.getenv("HF_DATASET_PATH", "responses.csv")  
+# Folder in the dataset repo; each participant is written as its own file.
+# HF_DATASET_PATH (the old single responses.csv) is no longer written to.
+HF_RESPONSES_DIR = os.getenv("HF_RESPONSES_DIR", "responses").strip("/")
+# Submissions are committed together once this many are pending or the interval (seconds) passes
+HF_COMMIT_BATCH_SIZE = int(os.getenv("HF_COMMIT_BATCH_SIZE", "10"))
+HF_COMMIT_INTERVAL = float(os.getenv("HF_COMMIT_INTERVAL", "60"))
+# A failed batch commit is retried this many times (with growing delays) before submitters see an error
+HF_COMMIT_RETRIES = int(os.getenv("HF_COMMIT_RETRIES", "3"))
+# Worst case before a submitter's future resolves: the first batch wait plus
+# retry n waiting n intervals (see flush_pending)
+HF_UPLOAD_MAX_WAIT = HF_COMMIT_INTERVAL * (1 + HF_COMMIT_RETRIES * (HF_COMMIT_RETRIES + 1) / 2)
 
 # Basic validations
 if not HF_TOKEN:
@@ -29,9 +45,13 @@ if not HF_TOKEN:
 if not HF_DATASET_REPO:
     st.error("Missing HF_DATASET_REPO in .env")
 
-# Init HF client
-hf_api = HfApi()
-HfFolder.save_token(HF_TOKEN)
+# Init HF client once per process; save_token writes to disk on every call
+@st.cache_resource(show_spinner=False)
+def get_hf_api() -> HfApi:
+    HfFolder.save_token(HF_TOKEN)
+    return HfApi(token=HF_TOKEN)
+
+hf_api = get_hf_api()
 
 st.set_page_config(page_title="Empathetic vs. Neutral AI Voice Study", page_icon="🎙", layout="centered")
 
@@ -40,7 +60,7 @@ st.set_page_config(page_title="Empathetic vs. Neutral AI Voice Study", page_icon
 # ----------------------------------------------------
 
 # Available voices for Web Speech API (browser-dependent)
-VOICE_OPTIONS = {
+VOICE_OPTIONS = MappingProxyType({
     "Female Voice 1": {
         "gender": "Female",
         "accent": "American", 
@@ -81,39 +101,125 @@ VOICE_OPTIONS = {
         "rate": 1.2,
         "pitch": 0.8
     }
-}
+})
+
+# Selectbox labels are built once per process rather than on every rerun
+VOICE_OPTION_LABELS = tuple(f"{name} — {info['gender']} | {info['accent']} | {info['description']}"
+                            for name, info in VOICE_OPTIONS.items())
+VOICE_LABEL_TO_NAME = {label: label.split(" — ")[0] for label in VOICE_OPTION_LABELS}
+
+# ----------------------------------------------------
+# Questionnaire Items
+# ----------------------------------------------------
+
+# GAD-7
+gad_items = (
+    "Q7.1 Feeling nervous, anxious, or on edge.",
+    "Q7.2 Not being able to stop or control worrying.",
+    "Q7.3 Worrying too much about different things.",
+    "Q7.4 Trouble relaxing.",
+    "Q7.5 Being so restless that it is hard to sit still.",
+    "Q7.6 Becoming easily annoyed or irritable.",
+    "Q7.7 Feeling afraid as if something awful might happen."
+)
+gad_scale = (1, 2, 3, 4)
+
+# PANAS
+panas_items = ("Interested","Distressed","Excited","Upset","Strong","Guilty","Scared","Hostile(Aggressive)","Enthusiastic","Proud")
+
+# 1-5 ratings (PANAS, single mood, state anxiety)
+rating_scale = (1, 2, 3, 4, 5)
+anxiety_labels = ("Not at all anxious", "Slightly anxious", "Moderately anxious", "Very anxious", "Extremely anxious")
+
+# Likert scale options
+five_scale = ("1 = Strongly Disagree", "2", "3", "4", "5 = Strongly Agree")
+
+# Define questions
+empathetic_questions = MappingProxyType({
+    "Q11": "I felt the voice was warm and caring.",
+    "Q12": "The voice seemed to understand or respond to my feelings.",
+    "Q13": "I felt comfortable listening to this voice.",
+    "Q14": "The voice spoke in a calm, soothing tone.",
+    "Q15": "I would trust this voice to give helpful advice.",
+    "Q16": "The voice helped me feel supported.",
+    "Q17": "The pace (speed) of the voice's speech was comfortable.",
+    "Q18": "I found it easy to pay attention to this voice."
+})
+
+neutral_questions = MappingProxyType({
+    "Q20": "The voice sounded neutral or robotic (monotone).",
+    "Q21": "I felt the voice gave factual, impersonal responses.",
+    "Q22": "I felt comfortable listening to this voice.",
+    "Q23": "I would trust this voice to give accurate information.",
+    "Q24": "The voice's tone seemed emotionless.",
+    "Q25": "The pace of the voice's speech was comfortable.",
+    "Q26": "I found it easy to pay attention to this voice.",
+    "Q27": "The voice delivered the information clearly and understandably."
+})
+
+# (record column, session_state sub-key) pairs used to flatten answers on submit
+GAD_KEYS = tuple((f"gad_q{i}", f"q{i}") for i in range(1, 8))
+PANAS_KEYS = tuple((f"panas_q{i}", f"q{i}") for i in range(1, 11))
+EMP_KEYS = tuple((f"emp_q{i}", f"q{i}") for i in range(1, 9))
+EMP_POST_KEYS = tuple((f"emp_post_q{i}", f"q{i}") for i in range(1, 8))
+NEU_KEYS = tuple((f"neu_q{i}", f"q{i}") for i in range(1, 9))
+NEU_POST_KEYS = tuple((f"neu_post_q{i}", f"q{i}") for i in range(1, 8))
+OPEN_KEYS = ("open_emp", "open_neu", "open_compare", "open_pref", "open_empathy",
+             "open_trust", "open_triggers", "open_improve", "open_more_1", "open_more_2")
 
 # ----------------------------------------------------
 # Helpers
 # ----------------------------------------------------
 
-def preprocess_text_for_tone(text, tone="neutral"):
-    """Adjust text to sound more empathetic or neutral"""
-    if tone == "empathetic":
+# Substitutions applied to the script text for each tone. None of the
+# replacements produce another key, so one alternation pass gives the same
+# result as applying them in sequence.
+TONE_SUBSTITUTIONS = {
+    "empathetic": {
         # Add pauses and softer language
-        text = text.replace(".", "... ")
-        text = text.replace(",", ", ")
+        ".": "... ",
+        ",": ", ",
         # Add breathing cues and gentler phrasing
-        text = text.replace("Take a slow breath", "Take a slow, deep breath")
-        text = text.replace("You're", "You are truly")
-    elif tone == "neutral":
+        "Take a slow breath": "Take a slow, deep breath",
+        "You're": "You are truly",
+    },
+    "neutral": {
         # Make more robotic/clinical
-        text = text.replace("I'm", "I am")
-        text = text.replace("you're", "you are") 
-        text = text.replace("it's", "it is")
-        text = text.replace("can't", "cannot")
+        "I'm": "I am",
+        "you're": "you are",
+        "it's": "it is",
+        "can't": "cannot",
         # Remove emotional language
-        text = text.replace("glad", "pleased")
-        text = text.replace("wonderful", "acceptable")
-        
-    return text
+        "glad": "pleased",
+        "wonderful": "acceptable",
+    },
+}
 
+# Longest keys first so a phrase wins over any shorter key it contains
+TONE_PATTERNS = {
+    tone: re.compile("|".join(re.escape(k) for k in sorted(table, key=len, reverse=True)))
+    for tone, table in TONE_SUBSTITUTIONS.items()
+}
+
+# Not memoized itself: its only caller, create_speech_html, is cached with
+# st.cache_data on the same text/tone, so repeat calls never reach this
+def preprocess_text_for_tone(text, tone="neutral"):
+    """Adjust text to sound more empathetic or neutral"""
+    if tone not in TONE_PATTERNS:
+        return text
+    table = TONE_SUBSTITUTIONS[tone]
+    return TONE_PATTERNS[tone].sub(lambda m: table[m.group(0)], text)
+
+# Bounded: participants can edit the script text, so each edit would add an entry
+@st.cache_data(show_spinner=False, max_entries=64)
 def create_speech_html(text, voice_config, tone="neutral", unique_id="speech"):
     """Create HTML with JavaScript for Web Speech API"""
     processed_text = preprocess_text_for_tone(text, tone)
     
-    # Escape text for JavaScript - more robust escaping
-    safe_text = processed_text.replace('\\', '\\\\').replace("'", "\\'").replace('"', '\\"').replace('\n', '\\n').replace('\r', '\\r')
+    # JSON string literals are valid JS literals (quotes included); "</" is
+    # escaped so the text can never close the surrounding <script> tag
+    safe_text = json.dumps(processed_text).replace("</", "<\\/")
+    gender = json.dumps(voice_config['gender'].lower())
     
     html_code = f"""
     <div style="margin: 10px 0; padding: 15px; border: 1px solid #ddd; border-radius: 8px; background-color: #f9f9f9;">
@@ -148,10 +254,17 @@ def create_speech_html(text, voice_config, tone="neutral", unique_id="speech"):
     (function() {{
         let utterance_{unique_id} = null;
         let voices_{unique_id} = [];
+        let resolvedVoice_{unique_id} = null;
         
-        // Load voices and update status
+        // Load voices, pick the one to use and update status
         function loadVoices_{unique_id}() {{
             voices_{unique_id} = speechSynthesis.getVoices();
+            // Look for female/male voices based on config, once per voice list
+            resolvedVoice_{unique_id} = voices_{unique_id}.find(voice => 
+                voice.name.toLowerCase().includes({gender}) ||
+                voice.name.toLowerCase().includes('female') && {gender} === 'female' ||
+                voice.name.toLowerCase().includes('male') && {gender} === 'male'
+            ) || voices_{unique_id}[0] || null;
             const debugEl = document.getElementById('debug_{unique_id}');
             if (debugEl) {{
                 debugEl.innerHTML = `Available voices: ${{voices_{unique_id}.length}} | Browser: ${{navigator.userAgent.split(' ').slice(-1)[0]}}`;
@@ -207,7 +320,7 @@ def create_speech_html(text, voice_config, tone="neutral", unique_id="speech"):
             
             statusEl.innerHTML = '<span style="color: blue;">🎵 Preparing audio...</span>';
             
-            const text = '{safe_text}';
+            const text = {safe_text};
             if (!text || text.trim() === '') {{
                 statusEl.innerHTML = '<span style="color: red;">❌ No text to speak.</span>';
                 return;
@@ -220,20 +333,9 @@ def create_speech_html(text, voice_config, tone="neutral", unique_id="speech"):
             utterance_{unique_id}.pitch = {voice_config['pitch']};
             utterance_{unique_id}.volume = 1.0;
             
-            // Try to set a specific voice
-            if (voices_{unique_id}.length > 0) {{
-                // Look for female/male voices based on config
-                const genderMatch = voices_{unique_id}.find(voice => 
-                    voice.name.toLowerCase().includes('{voice_config['gender'].lower()}') ||
-                    voice.name.toLowerCase().includes('female') && '{voice_config['gender'].lower()}' === 'female' ||
-                    voice.name.toLowerCase().includes('male') && '{voice_config['gender'].lower()}' === 'male'
-                );
-                
-                if (genderMatch) {{
-                    utterance_{unique_id}.voice = genderMatch;
-                }} else if (voices_{unique_id}[0]) {{
-                    utterance_{unique_id}.voice = voices_{unique_id}[0];
-                }}
+            // Use the voice picked when the voice list loaded
+            if (resolvedVoice_{unique_id}) {{
+                utterance_{unique_id}.voice = resolvedVoice_{unique_id};
             }}
             
             // Event handlers
@@ -298,109 +400,244 @@ def create_speech_html(text, voice_config, tone="neutral", unique_id="speech"):
     
     return html_code
 
-def load_existing_hf_csv(repo_id: str, path_in_repo: str) -> pd.DataFrame:
-    try:
-        local_path = hf_hub_download(
-            repo_id=repo_id,
-            repo_type="dataset",
-            filename=path_in_repo,
-            token=HF_TOKEN
+def commit_records(records: list):
+    """Upload a batch of responses, one JSONL file per participant, in a single commit"""
+    # A retried submission replaces the earlier one for the same participant
+    latest = {record["participant_id"]: record for record in records}
+    operations = [
+        CommitOperationAdd(
+            path_in_repo=f"{HF_RESPONSES_DIR}/{participant_id}.jsonl",
+            path_or_fileobj=json.dumps(record, default=str).encode("utf-8") + b"\n"
         )
-        return pd.read_csv(local_path)
-    except Exception:
-        return pd.DataFrame(columns=["participant_id"])
-
-def upload_csv_to_hf(df: pd.DataFrame, repo_id: str, path_in_repo: str):
-    tmp_path = "responses_tmp.csv"
-    df.to_csv(tmp_path, index=False)
-    hf_api.upload_file(
-        path_or_fileobj=tmp_path,
-        path_in_repo=path_in_repo,
-        repo_id=repo_id,
+        for participant_id, record in latest.items()
+    ]
+    hf_api.create_commit(
+        repo_id=HF_DATASET_REPO,
         repo_type="dataset",
+        operations=operations,
+        commit_message=f"Add {len(operations)} survey responses",
         token=HF_TOKEN
     )
 
+@st.cache_resource
+def get_upload_pool() -> ThreadPoolExecutor:
+    """Shared worker pool so uploads run off the script thread"""
+    return ThreadPoolExecutor(max_workers=2)
+
+def log_failed_upload(future: Future, participant_id: str):
+    """Done-callback so a failed upload is recorded even if the participant has left"""
+    if future.exception() is not None:
+        logger.error("Upload for participant %s failed", participant_id, exc_info=future.exception())
+
+@st.cache_resource
+def get_pending_batch() -> dict:
+    """Process-wide buffer of submissions waiting for the next commit"""
+    batch = {"lock": threading.Lock(), "items": [], "timer": None}
+    atexit.register(flush_pending, batch)
+    return batch
+
+def schedule_flush(batch: dict, delay: float):
+    """Start the flush timer unless one is already pending; caller holds batch["lock"]"""
+    if batch["timer"] is None:
+        batch["timer"] = threading.Timer(delay, flush_pending, args=(batch,))
+        batch["timer"].daemon = True
+        batch["timer"].start()
+
+def flush_pending(batch: dict):
+    """Commit everything buffered so far and resolve each submitter's future"""
+    with batch["lock"]:
+        items, batch["items"] = batch["items"], []
+        if batch["timer"] is not None:
+            batch["timer"].cancel()
+            batch["timer"] = None
+    if not items:
+        return
+    try:
+        commit_records([record for record, _, _ in items])
+    except Exception as e:
+        logger.exception("Committing %d survey responses failed", len(items))
+        # Put the records back and try again later; only give up after HF_COMMIT_RETRIES
+        retry = [(record, future, attempts + 1) for record, future, attempts in items
+                 if attempts < HF_COMMIT_RETRIES]
+        for _, future, attempts in items:
+            if attempts >= HF_COMMIT_RETRIES:
+                future.set_exception(e)
+        if retry:
+            with batch["lock"]:
+                batch["items"][:0] = retry
+                schedule_flush(batch, HF_COMMIT_INTERVAL * max(a for _, _, a in retry))
+    else:
+        for _, future, _ in items:
+            future.set_result(None)
+
+def queue_record(record: dict) -> Future:
+    """Buffer a submission until the batch fills up or HF_COMMIT_INTERVAL elapses"""
+    batch = get_pending_batch()
+    future = Future()
+    with batch["lock"]:
+        batch["items"].append((record, future, 0))
+        if len(batch["items"]) >= HF_COMMIT_BATCH_SIZE:
+            get_upload_pool().submit(flush_pending, batch)
+        else:
+            schedule_flush(batch, HF_COMMIT_INTERVAL)
+    return future
+
 def init_state():
-    defaults = {
-        "consented": False,
-        "step": "consent",
-        "participant_id": str(uuid.uuid4()),
-        "start_ts": datetime.utcnow().isoformat(),
+    # Factories so the uuid/timestamp are only computed when a key is missing
+    defaults = [
+        ("consented", lambda: False),
+        ("step", lambda: "consent"),
+        ("participant_id", lambda: str(uuid.uuid4())),
+        ("start_ts", lambda: datetime.utcnow().isoformat()),
         # Demographics
-        "age": None,
-        "gender": None,
-        "gender_other": "",
-        "education": None,
-        "voice_exp": None,
-        "used_assistants": None,
-        "tech_comfort": None,
+        ("age", lambda: None),
+        ("gender", lambda: None),
+        ("gender_other", lambda: ""),
+        ("education", lambda: None),
+        ("voice_exp", lambda: None),
+        ("used_assistants", lambda: None),
+        ("tech_comfort", lambda: None),
         # GAD-7
-        "gad": {f"q{i}": None for i in range(1, 8)},
-        "gad_impact": None,
+        ("gad", lambda: {f"q{i}": None for i in range(1, 8)}),
+        ("gad_impact", lambda: None),
         # PANAS
-        "panas": {f"q{i}": None for i in range(1, 11)},
-        "single_mood": None,
+        ("panas", lambda: {f"q{i}": None for i in range(1, 11)}),
+        ("single_mood", lambda: None),
         # Empathetic
-        "emp": {f"q{i}": None for i in range(1, 9)},
-        "emp_state_anxiety": None,
-        "emp_post": {f"q{i}": None for i in range(1, 8)},
+        ("emp", lambda: {f"q{i}": None for i in range(1, 9)}),
+        ("emp_state_anxiety", lambda: None),
+        ("emp_post", lambda: {f"q{i}": None for i in range(1, 8)}),
         # Neutral
-        "neu": {f"q{i}": None for i in range(1, 9)},
-        "neu_state_anxiety": None,
-        "neu_post": {f"q{i}": None for i in range(1, 8)},
+        ("neu", lambda: {f"q{i}": None for i in range(1, 9)}),
+        ("neu_state_anxiety", lambda: None),
+        ("neu_post", lambda: {f"q{i}": None for i in range(1, 8)}),
         # Open-ended
-        "open_emp": "",
-        "open_neu": "",
-        "open_compare": "",
-        "open_pref": "",
-        "open_empathy": "",
-        "open_trust": "",
-        "open_triggers": "",
-        "open_improve": "",
-        "open_more_1": "",
-        "open_more_2": "",
-    }
-    for k, v in defaults.items():
+        ("open_emp", lambda: ""),
+        ("open_neu", lambda: ""),
+        ("open_compare", lambda: ""),
+        ("open_pref", lambda: ""),
+        ("open_empathy", lambda: ""),
+        ("open_trust", lambda: ""),
+        ("open_triggers", lambda: ""),
+        ("open_improve", lambda: ""),
+        ("open_more_1", lambda: ""),
+        ("open_more_2", lambda: ""),
+    ]
+    for k, factory in defaults:
         if k not in st.session_state:
-            st.session_state[k] = v
+            st.session_state[k] = factory()
 
 def section_header(text):
     st.markdown(f"### {text}")
 
-init_state()
+# Likert grids: session_state answers field -> (data_editor key, scale options)
+GRID_WIDGETS = {
+    "gad": ("gad_grid", gad_scale),
+    "panas": ("panas_grid", rating_scale),
+    "emp": ("emp_grid", five_scale),
+    "neu": ("neu_grid", five_scale),
+}
 
-def scroll_to_top():
-    if st.session_state.get("step_changed", False):
-        st.markdown(
-            "<script>window.scrollTo({top: 0, behavior: 'smooth'});</script>",
-            unsafe_allow_html=True
-        )
-        st.session_state["step_changed"] = False
+def likert_grid(field, questions):
+    """Render a Likert battery as one editable grid, pre-filled from st.session_state[field]"""
+    import pandas as pd  # only needed once a participant reaches the questionnaires
+
+    key, options = GRID_WIDGETS[field]
+    answers = st.session_state[field]
+    grid = pd.DataFrame({
+        "Question": list(questions),
+        "Response": pd.Series([answers[f"q{i}"] for i in range(1, len(questions) + 1)], dtype="object"),
+    })
+    st.data_editor(
+        grid,
+        column_config={
+            "Question": st.column_config.TextColumn(width="large"),
+            "Response": st.column_config.SelectboxColumn(options=list(options)),
+        },
+        disabled=["Question"],
+        hide_index=True,
+        use_container_width=True,
+        key=key
+    )
+
+def store_grid_edits(answers, edits, options):
+    """Apply a grid's edited_rows onto its answers (q1..qN)"""
+    # Map cells back onto the option values (e.g. 3.0 -> 3); cleared cells become None
+    lookup = {option: option for option in options}
+    for row, change in edits.get("edited_rows", {}).items():
+        if "Response" in change:
+            answers[f"q{int(row) + 1}"] = lookup.get(change["Response"])
 
-scroll_to_top()
+init_state()
+
+SCROLL_TO_TOP_JS = "<script>window.scrollTo({top: 0, behavior: 'smooth'});</script>"
 
 def show_progress():
     current_step = st.session_state.get("step", "consent")
     current_index = steps.index(current_step)
     progress = (current_index + 1) / len(steps)
     st.progress(progress)
-    st.write(f"Step {current_index + 1} of {len(steps)}")
+    # Scroll script and step caption go out as one markdown element
+    scroll = SCROLL_TO_TOP_JS if st.session_state.get("step_changed", False) else ""
+    st.session_state["step_changed"] = False
+    st.markdown(f"{scroll}Step {current_index + 1} of {len(steps)}", unsafe_allow_html=True)
 
 show_progress()
 
+# Navigation uses on_click callbacks, so the page body doesn't run again with the
+# values sent by the click (text edits, or a whole form on submit). Those widgets
+# are keyed and copied into their session_state field in go_to_step.
+WIDGET_KEYS = {k: f"{k}_input" for k in ("age", "gender_other", "gad_impact", "single_mood") + OPEN_KEYS}
+WIDGET_KEYS.update({"emp_state_anxiety": "emp_anxiety", "neu_state_anxiety": "neu_anxiety"})
+
+def store_widget_values():
+    for k, widget_key in WIDGET_KEYS.items():
+        if widget_key in st.session_state:
+            st.session_state[k] = st.session_state[widget_key]
+    for k, (widget_key, options) in GRID_WIDGETS.items():
+        if widget_key in st.session_state:
+            store_grid_edits(st.session_state[k], st.session_state[widget_key], options)
+
+def go_to_step(step):
+    store_widget_values()
+    st.session_state["step"] = step
+    st.session_state["step_changed"] = True
+
+def continue_if_answered(step, grids):
+    """Move forward only once every item in the page's Likert grids has an answer"""
+    store_widget_values()
+    missing = sum(list(st.session_state[field].values()).count(None) for field in grids)
+    if missing:
+        # Shown by form_navigation when the page re-renders
+        st.session_state["nav_warning"] = (
+            f"{missing} rating(s) in the table(s) above are still blank. "
+            "Please answer every item before continuing."
+        )
+        return
+    st.session_state["step"] = step
+    st.session_state["step_changed"] = True
+
 def navigation_buttons(prev_step=None, next_step=None, prev_label="⬅ Back", next_label="Continue ➡"):
     cols = st.columns([1,1])
     with cols[0]:
-        if prev_step and st.button(prev_label, key=f"back_{prev_step}"):
-            st.session_state["step"] = prev_step
-            st.session_state["step_changed"] = True
-            st.rerun()
+        if prev_step:
+            st.button(prev_label, key=f"back_{prev_step}", on_click=go_to_step, args=(prev_step,))
     with cols[1]:
-        if next_step and st.button(next_label, key=f"next_{next_step}"):
-            st.session_state["step"] = next_step
-            st.session_state["step_changed"] = True
-            st.rerun()
+        if next_step:
+            st.button(next_label, key=f"next_{next_step}", on_click=go_to_step, args=(next_step,))
+
+def form_navigation(prev_step=None, next_step=None, prev_label="⬅ Back", next_label="Continue ➡", grids=()):
+    """Back/Continue submit buttons for questionnaire pages wrapped in st.form"""
+    warning = st.session_state.pop("nav_warning", None)
+    if warning:
+        st.warning(warning)
+    cols = st.columns([1,1])
+    with cols[0]:
+        if prev_step:
+            st.form_submit_button(prev_label, on_click=go_to_step, args=(prev_step,))
+    with cols[1]:
+        if next_step:
+            st.form_submit_button(next_label, on_click=continue_if_answered, args=(next_step, grids))
 
 # Initialize session state
 if "step" not in st.session_state:
@@ -446,12 +683,12 @@ above and agree to participate. """)
 
 if st.session_state["step"] == "demographics":
     st.header("Demographic Information")
-    st.session_state["age"] = st.number_input("Q1. Enter your age (years)", min_value=18, max_value=120, step=1)
+    st.session_state["age"] = st.number_input("Q1. Enter your age (years)", min_value=18, max_value=120, step=1, key=WIDGET_KEYS["age"])
     gender_choice = st.selectbox("Q2. Your gender",
                                  ["Female", "Male", "Non-binary/Other (specify)", "Prefer not to say"])
     st.session_state["gender"] = gender_choice
     if gender_choice == "Non-binary/Other (specify)":
-        st.session_state["gender_other"] = st.text_input("Please specify:")
+        st.session_state["gender_other"] = st.text_input("Please specify:", key=WIDGET_KEYS["gender_other"])
     st.session_state["education"] = st.selectbox(
         "Q3. Select your highest education level",
         ["High school or less", "Some college/Associate's", "Bachelor's degree", "Postgraduate degree"]
@@ -467,75 +704,40 @@ if st.session_state["step"] == "demographics":
 # -----------------------------
 if st.session_state["step"] == "baseline":
     st.header("Baseline Mental Health and Mood")
-    section_header("A. Anxiety – GAD-7 (Generalized Anxiety Disorder Scale)")
-    st.write("""
+    with st.form("baseline_form"):
+        section_header("A. Anxiety – GAD-7 (Generalized Anxiety Disorder Scale)")
+        st.write("""
 The GAD-7 is a brief, standardized questionnaire used by clinicians and researchers 
 to measure symptoms of generalized anxiety. It asks about common feelings and 
 behaviors related to anxiety over the past two weeks. Your answers will help us 
 understand your baseline level of anxiety before the voice sessions.
 """)
-    st.write("""Q7.Over the past 2 weeks, how often have you been bothered by the following problems? """)
-    st.write("""Select an option for each question""")
-    st.write("""Scale: 1 = Not at all 2 = Several days 3 = More than half the days 4 = Nearly every day .""")
-    gad_items = [
-        "Q7.1 Feeling nervous, anxious, or on edge.",
-        "Q7.2 Not being able to stop or control worrying.",
-        "Q7.3 Worrying too much about different things.",
-        "Q7.4 Trouble relaxing.",
-        "Q7.5 Being so restless that it is hard to sit still.",
-        "Q7.6 Becoming easily annoyed or irritable.",
-        "Q7.7 Feeling afraid as if something awful might happen."
-    ]
-    gad_scale = [1, 2, 3, 4]
-    for i, label in enumerate(gad_items, start=1):
-        st.session_state["gad"][f"q{i}"] = st.radio(label, gad_scale, horizontal=True)
-    st.session_state["gad_impact"] = st.radio(" Q8. If you checked any problems above, how difficult have these made it for you to do your work, take care of things at home, or get along with other people??", ["Not difficult", "Somewhat", "Very", "Extremely"])
-
-    section_header("B. Current Mood – PANAS - Positive and Negative Affect Schedule")
-    st.write("""
+        st.markdown("\n\n".join([
+            "Q7.Over the past 2 weeks, how often have you been bothered by the following problems? ",
+            "Select an option for each question",
+            "Scale: 1 = Not at all 2 = Several days 3 = More than half the days 4 = Nearly every day .",
+        ]))
+        likert_grid("gad", gad_items)
+        st.session_state["gad_impact"] = st.radio(" Q8. If you checked any problems above, how difficult have these made it for you to do your work, take care of things at home, or get along with other people??", ["Not difficult", "Somewhat", "Very", "Extremely"], key=WIDGET_KEYS["gad_impact"])
+
+        section_header("B. Current Mood – PANAS - Positive and Negative Affect Schedule")
+        st.write("""
 The PANAS is a short questionnaire that measures positive and negative emotions. 
 It helps us understand your current mood by asking how strongly you feel 
 different emotions right now. This provides a snapshot of your emotional state 
 before the voice sessions.
 """)
-    st.write("""Q9.Right now, to what extent do you feel each of the following emotions?""")
-    st.write("""Select an option for each question""") 
-    st.write("""Scale: 1 = Very slightly or not at all 2 = A little 3 = Moderately 4 = Quite a bit 5 = Extremely""")
-    panas_items = ["Interested","Distressed","Excited","Upset","Strong","Guilty","Scared","Hostile(Aggressive)","Enthusiastic","Proud"]
-    five_scale = [1,2,3,4,5]
-    for i, label in enumerate(panas_items, start=1):
-        st.session_state["panas"][f"q{i}"] = st.radio(f"Q9.{i} {label}", five_scale, horizontal=True)
-
-    st.write("""Single-Item Mood Rating """)
-    st.session_state["single_mood"] = st.radio("Q10.Overall, right now I feel… (1=very negative, 5=very positive):", [1,2,3,4,5], horizontal=True)
+        st.markdown("\n\n".join([
+            "Q9.Right now, to what extent do you feel each of the following emotions?",
+            "Select an option for each question",
+            "Scale: 1 = Very slightly or not at all 2 = A little 3 = Moderately 4 = Quite a bit 5 = Extremely",
+        ]))
+        likert_grid("panas", [f"Q9.{i} {label}" for i, label in enumerate(panas_items, start=1)])
 
-    navigation_buttons(prev_step="demographics", next_step="session_emp")
+        st.write("""Single-Item Mood Rating """)
+        st.session_state["single_mood"] = st.radio("Q10.Overall, right now I feel… (1=very negative, 5=very positive):", rating_scale, horizontal=True, key=WIDGET_KEYS["single_mood"])
 
-# Likert scale options
-five_scale = ["1 = Strongly Disagree", "2", "3", "4", "5 = Strongly Agree"]
-
-# Define questions
-empathetic_questions = {
-    "Q11": "I felt the voice was warm and caring.",
-    "Q12": "The voice seemed to understand or respond to my feelings.",
-    "Q13": "I felt comfortable listening to this voice.",
-    "Q14": "The voice spoke in a calm, soothing tone.",
-    "Q15": "I would trust this voice to give helpful advice.",
-    "Q16": "The voice helped me feel supported.",
-    "Q17": "The pace (speed) of the voice's speech was comfortable.",
-    "Q18": "I found it easy to pay attention to this voice."
-}
-
-neutral_questions = {
-    "Q20": "The voice sounded neutral or robotic (monotone).",
-    "Q21": "I felt the voice gave factual, impersonal responses.",
-    "Q22": "I felt comfortable listening to this voice.",
-    "Q23": "I would trust this voice to give accurate information.",
-    "Q24": "The voice's tone seemed emotionless.",
-    "Q25": "The pace of the voice's speech was comfortable.",
-    "Q26": "I found it easy to pay attention to this voice.",
-    "Q27": "The voice delivered the information clearly and understandably."
-}
+        form_navigation(prev_step="demographics", next_step="session_emp", grids=("gad", "panas"))
 
 # -----------------------------
 # Empathetic Voice Session
@@ -545,15 +747,12 @@ if st.session_state["step"] == "session_emp":
     st.write("""Instructions: For each voice session, please rate the following statements about that voice on a 5-point scale:""")
 
     # Voice selection for empathetic session
-    voice_options = [f"{name} — {info['gender']} | {info['accent']} | {info['description']}" 
-                    for name, info in VOICE_OPTIONS.items()]
-    
     emp_voice_label = st.selectbox(
         "Choose empathetic voice:",
-        voice_options,
+        VOICE_OPTION_LABELS,
         key="emp_voice_select"
     )
-    emp_voice_name = emp_voice_label.split(" — ")[0]
+    emp_voice_name = VOICE_LABEL_TO_NAME[emp_voice_label]
 
     # Text area for empathetic script
     emp_script = st.text_area(
@@ -571,21 +770,21 @@ You deserve kindness, and I'm proud of you for taking this moment for yourself."
     speech_html = create_speech_html(emp_script, voice_config, tone="empathetic", unique_id="empathetic")
     components.html(speech_html, height=300, scrolling=False)
 
-    st.subheader("AI Voice Interaction Questions (Empathetic Voice)")
-    for i, (key, question) in enumerate(empathetic_questions.items(), start=11):
-        st.session_state["emp"][f"q{i-10}"] = st.radio(f"Q{i}. {question}", five_scale, key=key, horizontal=True)
+    with st.form("emp_form"):
+        st.subheader("AI Voice Interaction Questions (Empathetic Voice)")
+        likert_grid("emp", [f"{key}. {question}" for key, question in empathetic_questions.items()])
 
-    st.subheader("During-Interaction Anxiety (State Anxiety)")
-    st.write("""Q19.After this empathetic voice session, please indicate how anxious you felt during the session by selecting a number from 1 to 5:""")
+        st.subheader("During-Interaction Anxiety (State Anxiety)")
+        st.write("""Q19.After this empathetic voice session, please indicate how anxious you felt during the session by selecting a number from 1 to 5:""")
 
-    st.session_state["emp_state_anxiety"] = st.radio(
-        "",
-        [1, 2, 3, 4, 5],
-        format_func=lambda x: f"{x} = {['Not at all anxious','Slightly anxious','Moderately anxious','Very anxious','Extremely anxious'][x-1]}",
-        key="emp_anxiety"
-    )
+        st.session_state["emp_state_anxiety"] = st.radio(
+            "",
+            rating_scale,
+            format_func=lambda x: f"{x} = {anxiety_labels[x-1]}",
+            key=WIDGET_KEYS["emp_state_anxiety"]
+        )
 
-    navigation_buttons(prev_step="baseline", next_step="session_neu")
+        form_navigation(prev_step="baseline", next_step="session_neu", grids=("emp",))
 
 # -----------------------------
 # Neutral Voice Session
@@ -595,15 +794,12 @@ if st.session_state["step"] == "session_neu":
     st.write("""Instructions: For each voice session, please rate the following statements about that voice on a 5-point scale:""")
 
     # Voice selection for neutral session
-    voice_options = [f"{name} — {info['gender']} | {info['accent']} | {info['description']}" 
-                    for name, info in VOICE_OPTIONS.items()]
-    
     neu_voice_label = st.selectbox(
         "Choose neutral voice:",
-        voice_options,
+        VOICE_OPTION_LABELS,
         key="neu_voice_select"
     )
-    neu_voice_name = neu_voice_label.split(" — ")[0]
+    neu_voice_name = VOICE_LABEL_TO_NAME[neu_voice_label]
 
     # Text area for neutral script
     neu_script = st.text_area(
@@ -622,21 +818,21 @@ Your participation is valuable, and your responses will help us better understan
     speech_html = create_speech_html(neu_script, voice_config, tone="neutral", unique_id="neutral")
     components.html(speech_html, height=300, scrolling=False)
 
-    st.subheader("AI Voice Interaction Questions (Neutral Voice)")
-    for i, (key, question) in enumerate(neutral_questions.items(), start=20):
-        st.session_state["neu"][f"q{i-19}"] = st.radio(f"Q{i}. {question}", five_scale, key=key, horizontal=True)
+    with st.form("neu_form"):
+        st.subheader("AI Voice Interaction Questions (Neutral Voice)")
+        likert_grid("neu", [f"{key}. {question}" for key, question in neutral_questions.items()])
 
-    st.subheader("During-Interaction Anxiety (State Anxiety)")
-    st.write("""Q28.After this robotic voice session, please indicate how anxious you felt during the session by selecting a number from 1 to 5:""")
+        st.subheader("During-Interaction Anxiety (State Anxiety)")
+        st.write("""Q28.After this robotic voice session, please indicate how anxious you felt during the session by selecting a number from 1 to 5:""")
 
-    st.session_state["neu_state_anxiety"] = st.radio(
-        "",
-        [1, 2, 3, 4, 5],
-        format_func=lambda x: f"{x} = {['Not at all anxious','Slightly anxious','Moderately anxious','Very anxious','Very anxious','Extremely anxious'][x-1]}",
-        key="neu_anxiety"
-    )
+        st.session_state["neu_state_anxiety"] = st.radio(
+            "",
+            rating_scale,
+            format_func=lambda x: f"{x} = {anxiety_labels[x-1]}",
+            key=WIDGET_KEYS["neu_state_anxiety"]
+        )
 
-    navigation_buttons(prev_step="session_emp", next_step="open")
+        form_navigation(prev_step="session_emp", next_step="open", grids=("neu",))
 
 # -----------------------------
 # Open-Ended Feedback
@@ -644,27 +840,28 @@ Your participation is valuable, and your responses will help us better understan
 if st.session_state["step"] == "open":
     st.header("Open-Ended Qualitative Questions")
     st.write("**Feel free to write as much as you like; there are no right or wrong answers.**")
-    st.write("**Empathetic Voice Experience**")
-    st.session_state["open_emp"] = st.text_area("Q29.How did you feel during and after interacting with the empathetic AI voice? What kinds of emotions, thoughts, or reactions did it bring up for you? ")
-    st.write("**Neutral Voice Experience**")
-    st.session_state["open_neu"] = st.text_area("Q30.How did you feel during and after interacting with the neutral or robotic AI voice? What kinds of emotions, thoughts, or reactions did it bring up for you?")
-    st.write("**Comparison of voices**")
-    st.session_state["open_compare"] = st.text_area("Q31.What differences, if any, did you notice between the two voices in terms of how they made you feel? Which one made you feel more comfortable or anxious, and why? ")
-    st.write("**Voice Preference**")
-    st.session_state["open_pref"] = st.text_area("Q32.Which voice did you prefer overall? What specific features (tone, pace, warmth, etc.) did you like or dislike about each voice?")
-    st.write("**Perceived Empathy and Understanding**")
-    st.session_state["open_empathy"] = st.text_area("Q33.Did the empathetic voice make you feel understood or cared for in any way? If so, can you describe a moment or response that gave you that feeling? ")
-    st.write("**Trust & Usefulness**")
-    st.session_state["open_trust"] = st.text_area("Q34.Did you feel that either voice was trustworthy or helpful? Why or why not? In what ways did the voice help (or fail to help) you feel supported? ")
-    st.write("**Triggers and Discomfort**")
-    st.session_state["open_triggers"] = st.text_area("Q35.Was there anything in either voice interaction that made you feel uneasy, anxious, or emotionally uncomfortable? Please explain if so.")
-    st.write("**Improvement Suggestions**")
-    st.session_state["open_improve"] = st.text_area("Q36.If you could improve or change anything about the voices or how the interaction worked, what would you recommend to make it more helpful or emotionally supportive? ")
-    st.write("**Additional Reflections**")
-    st.session_state["open_more_1"] = st.text_area("Q37.Is there anything else you'd like to share about your experience in this study?")
-    st.session_state["open_more_2"] = st.text_area("Q38.Any thoughts that haven't been covered by the previous questions?")
-
-    navigation_buttons(prev_step="session_neu", next_step="review", next_label="Review & Submit ➡")
+    with st.form("open_form"):
+        st.write("**Empathetic Voice Experience**")
+        st.session_state["open_emp"] = st.text_area("Q29.How did you feel during and after interacting with the empathetic AI voice? What kinds of emotions, thoughts, or reactions did it bring up for you? ", key=WIDGET_KEYS["open_emp"])
+        st.write("**Neutral Voice Experience**")
+        st.session_state["open_neu"] = st.text_area("Q30.How did you feel during and after interacting with the neutral or robotic AI voice? What kinds of emotions, thoughts, or reactions did it bring up for you?", key=WIDGET_KEYS["open_neu"])
+        st.write("**Comparison of voices**")
+        st.session_state["open_compare"] = st.text_area("Q31.What differences, if any, did you notice between the two voices in terms of how they made you feel? Which one made you feel more comfortable or anxious, and why? ", key=WIDGET_KEYS["open_compare"])
+        st.write("**Voice Preference**")
+        st.session_state["open_pref"] = st.text_area("Q32.Which voice did you prefer overall? What specific features (tone, pace, warmth, etc.) did you like or dislike about each voice?", key=WIDGET_KEYS["open_pref"])
+        st.write("**Perceived Empathy and Understanding**")
+        st.session_state["open_empathy"] = st.text_area("Q33.Did the empathetic voice make you feel understood or cared for in any way? If so, can you describe a moment or response that gave you that feeling? ", key=WIDGET_KEYS["open_empathy"])
+        st.write("**Trust & Usefulness**")
+        st.session_state["open_trust"] = st.text_area("Q34.Did you feel that either voice was trustworthy or helpful? Why or why not? In what ways did the voice help (or fail to help) you feel supported? ", key=WIDGET_KEYS["open_trust"])
+        st.write("**Triggers and Discomfort**")
+        st.session_state["open_triggers"] = st.text_area("Q35.Was there anything in either voice interaction that made you feel uneasy, anxious, or emotionally uncomfortable? Please explain if so.", key=WIDGET_KEYS["open_triggers"])
+        st.write("**Improvement Suggestions**")
+        st.session_state["open_improve"] = st.text_area("Q36.If you could improve or change anything about the voices or how the interaction worked, what would you recommend to make it more helpful or emotionally supportive? ", key=WIDGET_KEYS["open_improve"])
+        st.write("**Additional Reflections**")
+        st.session_state["open_more_1"] = st.text_area("Q37.Is there anything else you'd like to share about your experience in this study?", key=WIDGET_KEYS["open_more_1"])
+        st.session_state["open_more_2"] = st.text_area("Q38.Any thoughts that haven't been covered by the previous questions?", key=WIDGET_KEYS["open_more_2"])
+
+        form_navigation(prev_step="session_neu", next_step="review", next_label="Review & Submit ➡")
 
 # -----------------------------
 # Review & Submit
@@ -672,7 +869,10 @@ if st.session_state["step"] == "open":
 if st.session_state["step"] == "review":
     st.header("Review & Submit")
     st.write("Click **Submit** to upload your responses")
-    if st.button("Submit"):
+    upload = st.session_state.get("upload_future")
+    # Only offer Submit when nothing is in flight or the last upload failed
+    can_submit = upload is None or (upload.done() and upload.exception() is not None)
+    if can_submit and st.button("Submit"):
         record = {
             "participant_id": st.session_state["participant_id"], 
             "start_ts_utc": st.session_state["start_ts"], 
@@ -684,22 +884,33 @@ if st.session_state["step"] == "review":
             "tech_comfort": st.session_state["tech_comfort"], 
             "single_mood": st.session_state["single_mood"]
         }
-        for i in range(1,8): record[f"gad_q{i}"]=st.session_state["gad"][f"q{i}"]
+        gad, panas = st.session_state["gad"], st.session_state["panas"]
+        emp, emp_post = st.session_state["emp"], st.session_state["emp_post"]
+        neu, neu_post = st.session_state["neu"], st.session_state["neu_post"]
+        record.update({rk: gad[sk] for rk, sk in GAD_KEYS})
         record["gad_impact"]=st.session_state["gad_impact"]
-        for i in range(1,11): record[f"panas_q{i}"]=st.session_state["panas"][f"q{i}"]
-        for i in range(1,9): record[f"emp_q{i}"]=st.session_state["emp"][f"q{i}"]
+        record.update({rk: panas[sk] for rk, sk in PANAS_KEYS})
+        record.update({rk: emp[sk] for rk, sk in EMP_KEYS})
         record["emp_state_anxiety"]=st.session_state["emp_state_anxiety"]
-        for i in range(1,8): record[f"emp_post_q{i}"]=st.session_state["emp_post"][f"q{i}"]
-        for i in range(1,9): record[f"neu_q{i}"]=st.session_state["neu"][f"q{i}"]
+        record.update({rk: emp_post[sk] for rk, sk in EMP_POST_KEYS})
+        record.update({rk: neu[sk] for rk, sk in NEU_KEYS})
         record["neu_state_anxiety"]=st.session_state["neu_state_anxiety"]
-        for i in range(1,8): record[f"neu_post_q{i}"]=st.session_state["neu_post"][f"q{i}"]
-        record.update({k: st.session_state[k] for k in ["open_emp","open_neu","open_compare","open_pref",
-                                                         "open_empathy","open_trust","open_triggers",
-                                                         "open_improve","open_more_1","open_more_2"]})
-        try:
-            existing_df = load_existing_hf_csv(HF_DATASET_REPO, HF_DATASET_PATH)
-            updated_df = pd.concat([existing_df,pd.DataFrame([record])],ignore_index=True)
-            upload_csv_to_hf(updated_df, HF_DATASET_REPO, HF_DATASET_PATH)
-            st.success("Submitted successfully!")
-        except Exception as e:
-            st.error(f"Upload failed: {e}")
\ No newline at end of file
+        record.update({rk: neu_post[sk] for rk, sk in NEU_POST_KEYS})
+        record.update({k: st.session_state[k] for k in OPEN_KEYS})
+        upload = queue_record(record)
+        upload.add_done_callback(lambda f, pid=record["participant_id"]: log_failed_upload(f, pid))
+        st.session_state["upload_future"] = upload
+
+    if upload is not None:
+        if not upload.done():
+            max_wait = (f"{HF_UPLOAD_MAX_WAIT:.0f} seconds" if HF_UPLOAD_MAX_WAIT < 120
+                        else f"{HF_UPLOAD_MAX_WAIT / 60:.0f} minutes")
+            st.info(f"Submission received, uploading... Please keep this page open until you see "
+                    f"**Submitted successfully!** Responses are saved in batches, which usually takes up to "
+                    f"{HF_COMMIT_INTERVAL:g} seconds; if the upload has to be retried it can take up to "
+                    f"{max_wait}.")
+            st.button("Check upload status")
+        elif upload.exception() is not None:
+            st.error(f"Upload failed: {upload.exception()}")
+        else:
+            st.success("Submitted successfully!")
\ No newline at end of file